@@ -3,14 +3,22 @@ import os
 
 # Optional numba dependency
 try:
-    from numba import njit
+    from numba import njit, prange
 
     print("Running with numba")
 except ImportError:
 
-    def njit(numba_function):
+    def njit(signature_or_function=None, **kwargs):
         """Dummy numba function"""
-        return numba_function
+        if callable(signature_or_function):
+            return signature_or_function
+
+        def wrapper(numba_function):
+            return numba_function
+
+        return wrapper
+
+    prange = range
 
     print("Running without numba")
 
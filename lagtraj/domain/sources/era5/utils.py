@@ -8,7 +8,7 @@ import pandas as pd
 import xarray as xr
 import datetime
 
-from .... import njit
+from .... import njit, prange
 from .constants import rg, rd, rv_over_rd_minus_one
 
 levels_file = Path(__file__).parent / "137levels.dat"
@@ -19,110 +19,168 @@ a_coeffs_137 = levels_table["a[Pa]"].values[1:]
 b_coeffs_137 = levels_table["b"].values[1:]
 
 
-@njit
+# explicit signatures (one per supported dtype) compile the kernel eagerly
+# for exactly these types, skipping type-inference and dispatch-table lookup
+# on every call; the ::1 layout hints let LLVM assume unit stride in the
+# innermost (level) axis
+_KERNEL_SIGNATURES = [
+    "void({f}[:, :, ::1], {f}[:, :, :, ::1], {f}[:, :, :, ::1],"
+    " {f}[:, :, :, ::1], {f}[:, :, :, ::1],"
+    " {f}[:, :, :, ::1], {f}[:, :, :, ::1])".format(f=f)
+    for f in ("f4", "f8")
+]
+
+
+@njit(
+    _KERNEL_SIGNATURES, parallel=True, fastmath=True, error_model="numpy", cache=True
+)
 def _calculate_heights_and_pressures(
-    p_surf, height_surf, a_coeffs, b_coeffs, t_field, q_field
+    height_surf, t_field, q_field, lp_h, lp_f, height_h, height_f
 ):
-    """Calculate heights and pressures at model levels using
-    the hydrostatic equation (not taking into account hydrometeors).
+    """Calculate heights at model levels using the hydrostatic
+    equation (not taking into account hydrometeors).
+
+    The half- and full-level pressures only depend on the surface
+    pressure and the level coefficients and are precomputed
+    (vectorized) by the caller as log-pressures `lp_h` and `lp_f`, so
+    that only the height recurrence remains in the inner loop, with
+    the log of each pressure ratio taken as a difference of
+    log-pressures. The heights are written in place into the
+    caller-allocated `height_h` and `height_f` output buffers, keeping
+    all allocation out of the kernel. Each (time, lat, lon) column
+    only carries state in the vertical so the columns are integrated
+    in parallel. The fields are laid out as (time, lat, lon, level) so
+    that the vertical integration of each column strides contiguous
+    memory.
     """
-    k_max = t_field.shape[0]
+    n_max = t_field.shape[0]
     j_max = t_field.shape[1]
     i_max = t_field.shape[2]
-    height_h = np.empty((k_max, j_max, i_max))
-    height_f = np.empty((k_max, j_max, i_max))
-    p_h = np.empty((k_max, j_max, i_max))
-    p_f = np.empty((k_max, j_max, i_max))
+    k_max = t_field.shape[3]
     rd_over_rg = rd / rg
-    for i in range(i_max):
-        for j in range(j_max):
-            p_s = p_surf[j, i]
-            p_h[k_max - 1, j, i] = p_s
-            p_h_k_plus = p_s
-            z_s = height_surf[j, i]
-            height_h[k_max - 1, j, i] = z_s
-            height_h_k_plus = z_s
-            for k in range(k_max - 2, -1, -1):
-                # Pressure at this half level
-                p_h_k = a_coeffs[k] + (b_coeffs[k] * p_s)
-                p_h[k, j, i] = p_h_k
-                # Pressure at corresponding full level
-                p_f_k_plus = 0.5 * (p_h_k + p_h_k_plus)
-                p_f[k + 1, j, i] = p_f_k_plus
-                # Virtual temperature
-                tvrd_over_rg = (
-                    rd_over_rg
-                    * t_field[k, j, i]
-                    * (1.0 + rv_over_rd_minus_one * q_field[k, j, i])
-                )
-                # Integration to half level first
-                height_f[k + 1, j, i] = height_h_k_plus + (
-                    tvrd_over_rg * np.log(p_h_k_plus / p_f_k_plus)
-                )
-                # Integration to full levels
-                # reset of scalar temporary variables
-                height_h_k_plus = height_h_k_plus + (
-                    tvrd_over_rg * np.log(p_h_k_plus / p_h_k)
-                )
-                height_h[k, j, i] = height_h_k_plus
-                p_h_k_plus = p_h_k
-            p_f_k_plus = 0.5 * p_h_k_plus
-            p_f[0, j, i] = p_f_k_plus
-            height_f[0, j, i] = height_h_k_plus + (
-                tvrd_over_rg * np.log(p_h_k_plus / p_f_k_plus)
+    for idx in prange(n_max * j_max * i_max):
+        n = idx // (j_max * i_max)
+        j = (idx // i_max) % j_max
+        i = idx % i_max
+        lp_h_k_plus = lp_h[n, j, i, k_max - 1]
+        z_s = height_surf[n, j, i]
+        height_h[n, j, i, k_max - 1] = z_s
+        height_h_k_plus = z_s
+        for k in range(k_max - 2, -1, -1):
+            # Log-pressure at this half level
+            lp_h_k = lp_h[n, j, i, k]
+            # Virtual temperature
+            tvrd_over_rg = (
+                rd_over_rg
+                * t_field[n, j, i, k]
+                * (1.0 + rv_over_rd_minus_one * q_field[n, j, i, k])
+            )
+            # Integration to half level first
+            height_f[n, j, i, k + 1] = height_h_k_plus + (
+                tvrd_over_rg * (lp_h_k_plus - lp_f[n, j, i, k + 1])
             )
+            # Integration to full levels
+            # reset of scalar temporary variables
+            height_h_k_plus = height_h_k_plus + (
+                tvrd_over_rg * (lp_h_k_plus - lp_h_k)
+            )
+            height_h[n, j, i, k] = height_h_k_plus
+            lp_h_k_plus = lp_h_k
+        height_f[n, j, i, 0] = height_h_k_plus + (
+            tvrd_over_rg * (lp_h_k_plus - lp_f[n, j, i, 0])
+        )
 
-    return height_h, height_f, p_h, p_f
 
+def calculate_heights_and_pressures(ds, dtype=np.float64):
+    """Calculates height and pressure fields to ERA5 model level data arrays
 
-def calculate_heights_and_pressures(ds):
-    """Calculates height and pressure fields to ERA5 model level data arrays"""
+    `dtype` may be set to np.float32 to halve the memory traffic of the
+    (memory-bound) height integration where ~1e-4 relative precision in
+    the heights is acceptable downstream."""
 
-    datasets = []
-    ds_ = ds
-    # `calculate_heights_and_pressures` expends the data to have the shape
-    # (level, lat, lon) so we explicitly expand the dataset here and squeeze
-    # later
+    # `_calculate_heights_and_pressures` expects the data to have the shape
+    # (time, level, lat, lon) so we explicitly expand the dataset here and
+    # squeeze later
     required_dims = ("time", "level", "lat", "lon")
+    surface_dims = ("time", "lat", "lon")
     missing_dims = list(filter(lambda d: d not in ds.dims, required_dims))
-    ds_ = ds_.expand_dims(missing_dims).transpose(*required_dims)
-
-    for t in ds_.time.values:
-        ds_time = ds_.sel(time=t)
-        p_surf = ds_time.sp.values
-        # Convert from geopotential to height
-        height_surf = ds_time.z.values / rg
-        t_field = ds_time.t.values
-        q_field = ds_time.q.values
-
-        height_dims = ds_time.t.dims
-        height_h, height_f, p_h, p_f = _calculate_heights_and_pressures(
-            p_surf, height_surf, a_coeffs_137, b_coeffs_137, t_field, q_field,
-        )
-        ds_extra = xr.Dataset(coords=ds_time.coords)
-        ds_extra["height_h"] = xr.DataArray(
-            height_h,
-            dims=height_dims,
-            attrs={"long_name": "height above sea level at half level", "units": "m",},
-        )
-        ds_extra["height_f"] = xr.DataArray(
-            height_f,
-            dims=height_dims,
-            attrs={"long_name": "height above sea level at full level", "units": "m",},
-        )
-        ds_extra["p_h"] = xr.DataArray(
-            p_h,
-            dims=height_dims,
-            attrs={"long_name": "pressure at half level", "units": "Pa"},
-        )
-        ds_extra["p_f"] = xr.DataArray(
-            p_f,
-            dims=height_dims,
-            attrs={"long_name": "pressure at full level", "units": "Pa"},
-        )
-        datasets.append(ds_extra)
+    if (
+        not missing_dims
+        and ds.t.dims == required_dims
+        and ds.q.dims == required_dims
+        and ds.sp.dims == surface_dims
+        and ds.z.dims == surface_dims
+    ):
+        # already in the required shape, so skip the Dataset rebuild (and
+        # potential data copy) that expand_dims/transpose trigger
+        ds_ = ds
+    else:
+        ds_ = ds.expand_dims(missing_dims).transpose(*required_dims)
+
+    p_surf = ds_.sp.values
+    # Convert from geopotential to height
+    height_surf = np.ascontiguousarray(ds_.z.values / rg, dtype=dtype)
+    # the kernel integrates over contiguous (lat, lon, level) columns,
+    # so reorder the fields before the call and undo it on the outputs
+    t_field = np.ascontiguousarray(ds_.t.values.transpose(0, 2, 3, 1), dtype=dtype)
+    q_field = np.ascontiguousarray(ds_.q.values.transpose(0, 2, 3, 1), dtype=dtype)
+
+    # the half- and full-level pressures only depend on the surface pressure
+    # and the level coefficients, so they are computed as vectorized
+    # expressions rather than per column inside the kernel (in float64 and
+    # only rounded to `dtype` afterwards)
+    p_h = a_coeffs_137 + b_coeffs_137 * p_surf[:, :, :, np.newaxis]
+    p_h[..., -1] = p_surf
+    p_f = np.empty_like(p_h)
+    p_f[..., 1:] = 0.5 * (p_h[..., :-1] + p_h[..., 1:])
+    p_f[..., 0] = 0.5 * p_h[..., 0]
+    # with log(p/p') written as log(p) - log(p') in the height recurrence,
+    # the logs can be taken vectorized here instead of twice per level
+    # inside the kernel
+    lp_h = np.ascontiguousarray(np.log(p_h), dtype=dtype)
+    lp_f = np.ascontiguousarray(np.log(p_f), dtype=dtype)
+    p_h = np.asarray(p_h, dtype=dtype)
+    p_f = np.asarray(p_f, dtype=dtype)
+
+    height_dims = ds_.t.dims
+    # the kernel writes into caller-allocated output buffers so that it
+    # does no allocation (or page-touching) itself
+    height_h = np.empty_like(t_field)
+    height_f = np.empty_like(t_field)
+    _calculate_heights_and_pressures(
+        height_surf, t_field, q_field, lp_h, lp_f, height_h, height_f,
+    )
+    height_h = height_h.transpose(0, 3, 1, 2)
+    height_f = height_f.transpose(0, 3, 1, 2)
+    p_h = p_h.transpose(0, 3, 1, 2)
+    p_f = p_f.transpose(0, 3, 1, 2)
+    ds_extra = xr.Dataset(
+        data_vars={
+            "height_h": (
+                height_dims,
+                height_h,
+                {"long_name": "height above sea level at half level", "units": "m"},
+            ),
+            "height_f": (
+                height_dims,
+                height_f,
+                {"long_name": "height above sea level at full level", "units": "m"},
+            ),
+            "p_h": (
+                height_dims,
+                p_h,
+                {"long_name": "pressure at half level", "units": "Pa"},
+            ),
+            "p_f": (
+                height_dims,
+                p_f,
+                {"long_name": "pressure at full level", "units": "Pa"},
+            ),
+        },
+        coords=ds_.coords,
+    )
 
-    return xr.concat(datasets, dim="time").squeeze()
+    return ds_extra.squeeze()
 
 
 def add_era5_global_attributes(ds, creation_datetime):
@@ -4,6 +4,7 @@ import warnings
 
 import xarray as xr
 import numpy as np
+import pandas as pd
 import tqdm
 
 from .. import DEFAULT_ROOT_DATA_PATH
@@ -154,13 +155,14 @@ def _build_times_dataarray(origin, duration, dt):
     t_min = origin.datetime - duration.backward
     t_max = origin.datetime + duration.forward
 
-    times = [t0]
-    while times[0] > t_min:
-        t_new = times[0] - dt
-        times.insert(0, t_new)
-    while times[-1] < t_max:
-        t_new = times[-1] + dt
-        times.append(t_new)
+    # the number of steps is rounded up so that t_min and t_max are always
+    # covered by the range (the integer floor-division on timedeltas keeps
+    # this exact, unlike float timedelta division)
+    n_backward = -((t_min - t0) // dt)
+    n_forward = -((t0 - t_max) // dt)
+    times = pd.date_range(end=t0, periods=n_backward + 1, freq=dt).union(
+        pd.date_range(start=t0, periods=n_forward + 1, freq=dt)
+    )
 
     return xr.DataArray(times, name="time", dims=("time"), coords=dict(time=times))
 
@@ -173,16 +175,17 @@ def create_eulerian_trajectory(origin, da_times):
     ds["origin_datetime"] = origin.datetime
     ds["origin_lat"] = xr.DataArray(lat0)
     ds["origin_lon"] = xr.DataArray(lon0)
-    ds["lat"] = ("time"), ds.origin_lat.item() * np.ones(len(ds.time))
-    ds["lon"] = ("time"), ds.origin_lon.item() * np.ones(len(ds.time))
+    n_times = ds.time.size
+    ds["lat"] = ("time"), np.full(n_times, ds.origin_lat.item())
+    ds["lon"] = ("time"), np.full(n_times, ds.origin_lon.item())
     ds["u_traj"] = (
         ("time",),
-        np.zeros(len(ds.time)),
+        np.zeros(n_times),
         {"long_name": "zonal velocity", "units": "m s**-1"},
     )
     ds["v_traj"] = (
         ("time",),
-        np.zeros(len(ds.time)),
+        np.zeros(n_times),
         {"long_name": "meridional velocity", "units": "m s**-1"},
     )
     ds["origin_lat"].attrs = {
@@ -205,6 +208,11 @@ def create_eulerian_trajectory(origin, da_times):
 
 def create_linear_trajectory(origin, da_times, U):
     """Create linear trajectory from origin point using constant velocity"""
+    # the trajectory is integrated step by step (rather than extrapolated
+    # from the origin in one call): chaining short great-circle segments
+    # whose bearing is re-derived from the constant (u, v) at every step
+    # keeps the path consistent with the recorded velocities, which a
+    # single great circle of the total length would not
 
     def extrapolation_func(lat, lon, t0, dt):
         if dt > 0:
@@ -246,60 +254,96 @@ def create_lagrangian_trajectory(
     )
 
 
-def _create_extrapolated_trajectory(origin, da_times, extrapolation_func):
-    ds_start_posn = xr.Dataset(coords=dict(time=origin.datetime))
-    ds_start_posn["lat"] = origin.lat
-    ds_start_posn["lon"] = origin.lon
-
-    da_times_backward = da_times.sel(time=slice(None, origin.datetime))
-    da_times_forward = da_times.sel(time=slice(origin.datetime, None))
-
-    # xarray doesn't have a `total_seconds` accessor for datetime objects yet
-    def _calculate_seconds(da):
-        return da.dt.seconds + da.dt.days * 24 * 60 * 60
+def _build_integration_times(origin, da_times):
+    """The times a trajectory is calculated at: the requested times plus
+    the origin time itself, which may fall between them"""
+    # keep the native time unit of `da_times` (rather than normalising to
+    # nanoseconds) so that interpolation targets taken from these times
+    # always match the resolution of the domain data's time coordinate
+    times = np.asarray(da_times.values)
+    t_origin = np.datetime64(
+        getattr(origin.datetime, "values", origin.datetime)
+    ).astype(times.dtype)
+    if t_origin not in times:
+        times = np.sort(np.concatenate([times, [t_origin]]))
+    return times, t_origin
 
-    points = [ds_start_posn]
 
+def _create_extrapolated_trajectory(origin, da_times, extrapolation_func):
+    times, t_origin = _build_integration_times(origin=origin, da_times=da_times)
+    idx_origin = int(np.searchsorted(times, t_origin))
+
+    # preallocate the trajectory variables and fill them in place while
+    # integrating outwards from the origin, rather than concatenating a
+    # single-point Dataset per timestep
+    n_times = len(times)
+    lats = np.empty(n_times)
+    lons = np.empty(n_times)
+    u_traj = np.full(n_times, np.nan)
+    v_traj = np.full(n_times, np.nan)
+    lats[idx_origin] = origin.lat
+    lons[idx_origin] = origin.lon
+
+    # all timestep lengths (in seconds) are computed in one go from the
+    # time axis rather than per step inside the integration loop
+    dt_seconds = np.diff(times) / np.timedelta64(1, "s")
+
+    is_first_step = True
     for dir in ["backward", "forward"]:
         if dir == "backward":
-            da_integrate_times = da_times_backward.values[::-1]
+            idxs_integrate = range(idx_origin - 1, -1, -1)
+            dts_integrate = -dt_seconds[idx_origin - 1 :: -1]
         elif dir == "forward":
-            da_integrate_times = da_times_forward.values
+            idxs_integrate = range(idx_origin + 1, n_times)
+            dts_integrate = dt_seconds[idx_origin:]
         else:
             raise Exception
 
-        for t in tqdm.tqdm(da_integrate_times, desc=dir):
-            ds_prev_posn = points[-1]
-            dt = _calculate_seconds(t - ds_prev_posn.time)
-            if int(dt) == 0:
-                continue
-            lat, lon, u_traj, v_traj = extrapolation_func(
-                lat=points[-1].lat, lon=points[-1].lon, dt=dt, t0=ds_prev_posn.time
+        # the progress bar only earns its per-step overhead on long
+        # integrations
+        if len(idxs_integrate) > 100:
+            idxs_integrate = tqdm.tqdm(idxs_integrate, desc=dir)
+
+        t_prev = t_origin
+        lat_prev = lats[idx_origin]
+        lon_prev = lons[idx_origin]
+        for idx, dt in zip(idxs_integrate, dts_integrate):
+            t = times[idx]
+            lat, lon, u_start_and_end, v_start_and_end = extrapolation_func(
+                lat=lat_prev, lon=lon_prev, dt=dt, t0=t_prev
             )
-            # u_traj and v_traj are tuples containing the start and end
-            # velocities for the trajectory
-            u_start, u_end = u_traj
-            v_start, v_end = v_traj
+            # u_start_and_end and v_start_and_end are tuples containing the
+            # start and end velocities for the trajectory
+            u_start, u_end = u_start_and_end
+            v_start, v_end = v_start_and_end
             # for the very first point we also want to record the starting
             # velocity which was calculated by the interpolation routine
-            if len(points) == 1:
-                points[0]["u_traj"] = u_start
-                points[0]["v_traj"] = v_start
+            if is_first_step:
+                u_traj[idx_origin] = u_start
+                v_traj[idx_origin] = v_start
+                is_first_step = False
 
-            ds_next_posn = xr.Dataset(coords=dict(time=t))
-            ds_next_posn["lat"] = lat
-            ds_next_posn["lon"] = lon
+            lats[idx] = lat
+            lons[idx] = lon
             # record the velocity at the end of the current timestep (at the
             # point in time of the new trajectory point)
-            ds_next_posn["u_traj"] = u_end
-            ds_next_posn["v_traj"] = v_end
-            points.append(ds_next_posn)
-
-        if dir == "backward":
-            # now we've integrated backwards we reverse the points
-            points = points[::-1]
-
-    ds_traj = xr.concat(points, dim="time").sortby("time")
+            u_traj[idx] = u_end
+            v_traj[idx] = v_end
+            t_prev = t
+            lat_prev = lat
+            lon_prev = lon
+
+    ds_traj = xr.Dataset(coords=dict(time=times))
+    ds_traj["lat"] = ("time",), lats
+    ds_traj["lon"] = ("time",), lons
+    ds_traj["u_traj"] = ("time",), u_traj
+    ds_traj["v_traj"] = ("time",), v_traj
+    return _finalise_trajectory(ds_traj=ds_traj, origin=origin)
+
+
+def _finalise_trajectory(ds_traj, origin):
+    """Add the origin variables, attributes and units shared by all
+    trajectory types to a trajectory dataset"""
     ds_traj["u_traj"].attrs = {"long_name": "zonal velocity", "units": "m s**-1"}
     ds_traj["v_traj"].attrs = {"long_name": "meridional velocity", "units": "m s**-1"}
     ds_traj["origin_lat"] = origin.lat
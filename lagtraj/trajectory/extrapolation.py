@@ -13,16 +13,18 @@ half_pi = 0.5 * pi
 
 def extrapolate_posn_with_fixed_velocity(lat, lon, u_vel, v_vel, dt):
     """Extrapolates a position from point (lat, lon) given velocities
-    (u_vel, v_vel) (in m/s) and a duration dt (in seconds)"""
-    # ensure that we're just working with floats in case xarray DataArray
-    # values (with coordinates) are passed in
-    lat = np.float64(lat)
-    lon = np.float64(lon)
-    u_vel = np.float64(u_vel)
-    v_vel = np.float64(v_vel)
-    dt = np.float64(dt)
+    (u_vel, v_vel) (in m/s) and a duration dt (in seconds). All arguments
+    may be arrays (broadcast against each other) so that many durations
+    can be extrapolated in one call"""
+    # ensure that we're just working with (arrays of) floats in case xarray
+    # DataArray values (with coordinates) are passed in
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    u_vel = np.asarray(u_vel, dtype=np.float64)
+    v_vel = np.asarray(v_vel, dtype=np.float64)
+    dt = np.asarray(dt, dtype=np.float64)
 
-    if dt < 0.0:
+    if np.any(dt < 0.0):
         raise Exception("Expecting positive dt in extrapolation")
     theta = np.arctan2(v_vel, u_vel) % two_pi
     bearing = (half_pi - theta) % two_pi